@@ -0,0 +1,6 @@
+"""
+性能基准测试包：确定性地生成指定规模的合成数据，运行文件导入、数据查询、界面渲染、删除、备份和分析等场景，
+统计吞吐量、延迟百分位和峰值内存，并与保存的基线结果比较以发现性能退化
+
+用法: python -m benchmark --scale small --repeat 5
+"""
@@ -0,0 +1,79 @@
+"""
+命令行入口: python -m benchmark [--scale small] [--scenarios get_data,analytics] [--save-baseline]
+"""
+import argparse
+import os
+import sys
+
+from benchmark.datagen import SCALES, scale_spec
+from benchmark.runner import (compare_with_baseline, copy_database, load_baseline, prepare_database, remove_database,
+                              run_scenario, save_results)
+from benchmark.scenarios import SCENARIOS
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="数据库管理系统性能基准测试")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="tiny", help="数据规模预设")
+    parser.add_argument("--students", type=int, help="学生人数（覆盖--scale）")
+    parser.add_argument("--exams-per-student", type=int, default=10, help="每个学生的成绩条数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔的场景名称")
+    parser.add_argument("--repeat", type=int, default=5, help="每个场景的重复次数")
+    parser.add_argument("--sample", type=int, default=50, help="逐条操作类场景的样本数量")
+    parser.add_argument("--import-rows", type=int, default=1000, help="文件导入场景的行数")
+    parser.add_argument("--cache-dir", default=".bench_cache", help="合成数据库缓存目录")
+    parser.add_argument("--output", help="结果输出文件（JSON）")
+    parser.add_argument("--baseline", help="基线文件，默认为benchmark/baselines/<学生人数>_<每个学生的成绩条数>_<随机种子>.json")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的性能波动比例")
+    args = parser.parse_args(argv)
+
+    students = args.students or SCALES[args.scale]
+    spec = scale_spec(students, args.exams_per_student)
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知的场景: {', '.join(unknown)}")
+
+    print(f"准备合成数据: {spec}")
+    db_path = prepare_database(spec, args.seed, args.cache_dir)
+    options = {"seed": args.seed, "repeat": args.repeat, "sample": args.sample, "import_rows": args.import_rows}
+
+    # 只读场景共用的数据库副本
+    shared_db_path = db_path + ".shared.tmp"
+    copy_database(db_path, shared_db_path)
+    results = {}
+    try:
+        for name in names:
+            result = run_scenario(name, db_path, shared_db_path, spec, options, SCENARIOS[name][1])
+            results[name] = result
+            if "error" in result:
+                print(f"{name:<16} 运行失败: {result['error']}")
+            else:
+                print(f"{name:<16} {result['rows_per_s']:>12.1f} 行/秒  p50 {result['p50_ms']:>9.2f}ms  "
+                      f"p95 {result['p95_ms']:>9.2f}ms  p99 {result['p99_ms']:>9.2f}ms  "
+                      f"峰值内存 {result['peak_rss_mb']:.1f}MB")
+    finally:
+        remove_database(shared_db_path)
+
+    if args.output:
+        save_results(args.output, results)
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"{students}_{args.exams_per_student}_{args.seed}.json")
+    if args.save_baseline:
+        save_results(baseline_path, results)
+        print(f"基线已保存到 {baseline_path}")
+        return 0
+    baseline = load_baseline(baseline_path)
+    if baseline is None:
+        print("未找到基线文件，跳过比较（使用--save-baseline保存基线）")
+        return 0
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"性能退化 {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+确定性的合成数据生成器，相同的规模参数和随机种子总是生成完全相同的数据库
+"""
+import csv
+import random
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+
+import ORM2
+
+# 规模预设（学生人数），其余实体数量按比例推算；large规模下成绩表约1000万行
+SCALES = {
+    "tiny": 1_000,
+    "small": 10_000,
+    "medium": 100_000,
+    "large": 1_000_000,
+}
+
+# 生成数据时每批插入的行数
+INSERT_BATCH = 10_000
+
+SECTIONS = ["代数", "几何", "函数", "概率", "统计", "数列", "三角", "向量"]
+DIFFICULTIES = ["简单", "中等", "困难"]
+ORGANIZATIONS = ["教务处", "数学组", "年级组", "联考"]
+SURNAMES = "赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张"
+GIVEN_NAMES = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂"
+
+
+def scale_spec(students, exams_per_student=10):
+    """
+    根据学生人数推算各实体的数量
+    :param students: 学生人数
+    :param exams_per_student: 每个学生参加的考试次数（成绩表行数 = 学生人数 × 该值）
+    """
+    exams = max(exams_per_student, students // 100)
+    return {
+        "students": students,
+        "exams": exams,
+        "questions": max(50, students // 10),
+        "tags": max(10, min(5_000, students // 200)),
+        "exams_per_student": exams_per_student,
+        "questions_per_exam": 20,
+        "tags_per_exam": 2,
+        "tags_per_question": 2,
+        "questions_per_student": 5,
+    }
+
+
+def random_name(rng):
+    return rng.choice(SURNAMES) + "".join(rng.choice(GIVEN_NAMES) for _ in range(rng.randint(1, 2)))
+
+
+def random_birth_date(rng):
+    return date(2005, 1, 1) + timedelta(days=rng.randrange(6 * 365))
+
+
+def _insert(conn, sql, rows):
+    """
+    按批次执行executemany插入
+    """
+    for start in range(0, len(rows), INSERT_BATCH):
+        conn.exec_driver_sql(sql, rows[start:start + INSERT_BATCH])
+
+
+def generate_database(db_path, spec, seed=42):
+    """
+    生成合成数据库文件
+    :param db_path: 数据库文件路径（已存在的文件会被覆盖写入）
+    :param spec: scale_spec返回的规模参数
+    :param seed: 随机种子
+    """
+    rng = random.Random(seed)
+    db_engine = create_engine(f"sqlite:///{db_path}")
+    # 通过DatabaseManager建表，保证表结构、索引与应用一致
+    ORM2.DatabaseManager(db_engine=db_engine)
+    with db_engine.begin() as conn:
+        conn.exec_driver_sql("PRAGMA synchronous=OFF")
+        today = date.today()
+        students = []
+        for student_id in range(1, spec["students"] + 1):
+            birth_date = random_birth_date(rng)
+            students.append((student_id, random_name(rng), birth_date.isoformat(), today.year - birth_date.year))
+        _insert(conn, "INSERT INTO students (id, name, birth_date, age) VALUES (?, ?, ?, ?)", students)
+
+        exams = []
+        for exam_id in range(1, spec["exams"] + 1):
+            exam_date = date(2020, 9, 1) + timedelta(days=rng.randrange(4 * 365))
+            exams.append((exam_id, f"E{exam_id:06d}", rng.choice(ORGANIZATIONS), exam_date.isoformat(), None))
+        _insert(conn, "INSERT INTO exams (id, exam_number, organization, time, paper_file) VALUES (?, ?, ?, ?, ?)", exams)
+
+        questions = [
+            (question_id, f"Q{question_id:07d}", rng.choice(SECTIONS), rng.choice(DIFFICULTIES),
+             f"第{question_id}题题干", None, None, None)
+            for question_id in range(1, spec["questions"] + 1)
+        ]
+        _insert(conn, "INSERT INTO questions (id, question_number, section, difficulty, content, image_path, file, "
+                      "related_questions) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", questions)
+
+        tags = [(tag_id, f"{rng.choice(SECTIONS)}-知识点{tag_id}") for tag_id in range(1, spec["tags"] + 1)]
+        _insert(conn, "INSERT INTO tags (id, content) VALUES (?, ?)", tags)
+
+        exam_ids = range(1, spec["exams"] + 1)
+        question_ids = range(1, spec["questions"] + 1)
+        tag_ids = range(1, spec["tags"] + 1)
+        _insert(conn, "INSERT INTO exam_question_association (exam_id, question_id) VALUES (?, ?)",
+                [(exam_id, question_id) for exam_id in exam_ids
+                 for question_id in rng.sample(question_ids, min(spec["questions_per_exam"], len(question_ids)))])
+        _insert(conn, "INSERT INTO tag_exam_association (tag_id, exam_id) VALUES (?, ?)",
+                [(tag_id, exam_id) for exam_id in exam_ids
+                 for tag_id in rng.sample(tag_ids, min(spec["tags_per_exam"], len(tag_ids)))])
+        _insert(conn, "INSERT INTO tag_question_association (tag_id, question_id) VALUES (?, ?)",
+                [(tag_id, question_id) for question_id in question_ids
+                 for tag_id in rng.sample(tag_ids, min(spec["tags_per_question"], len(tag_ids)))])
+
+        # 成绩和学生题目关联数据量最大，逐个学生生成后分批写入，避免一次性占用大量内存
+        scores = []
+        student_questions = []
+        for student_id in range(1, spec["students"] + 1):
+            for exam_id in rng.sample(exam_ids, spec["exams_per_student"]):
+                scores.append((student_id, exam_id, rng.randint(0, 150)))
+            for question_id in rng.sample(question_ids, min(spec["questions_per_student"], len(question_ids))):
+                student_questions.append((student_id, question_id))
+            if len(scores) >= INSERT_BATCH:
+                _insert(conn, "INSERT INTO student_exam_scores (student_id, exam_id, score) VALUES (?, ?, ?)", scores)
+                _insert(conn, "INSERT INTO student_questions (student_id, question_id) VALUES (?, ?)", student_questions)
+                scores, student_questions = [], []
+        _insert(conn, "INSERT INTO student_exam_scores (student_id, exam_id, score) VALUES (?, ?, ?)", scores)
+        _insert(conn, "INSERT INTO student_questions (student_id, question_id) VALUES (?, ?)", student_questions)
+    db_engine.dispose()
+
+
+def write_student_file(file_path, count, seed=42):
+    """
+    生成用于导入场景的学生数据CSV文件，格式与read_student_data_from_file一致
+    """
+    rng = random.Random(seed)
+    with open(file_path, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["name", "birth_date", "exam_scores", "exam_questions"])
+        for _ in range(count):
+            writer.writerow([random_name(rng), random_birth_date(rng).isoformat(), "[]", "[]"])
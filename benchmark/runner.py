@@ -0,0 +1,227 @@
+"""
+基准测试运行器：准备数据库、在独立子进程中运行各场景（保证峰值内存互不影响）、汇总结果并与基线比较
+"""
+import json
+import multiprocessing
+import os
+import random
+import queue as queue_module
+import resource
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from benchmark.datagen import generate_database
+
+
+class ScenarioContext:
+    """
+    场景运行上下文，提供数据库管理对象、临时目录以及计时方法
+    """
+
+    def __init__(self, manager, workdir, spec, seed, repeat, sample, import_rows):
+        self.manager = manager
+        self.workdir = workdir
+        self.spec = spec
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.repeat = repeat
+        self.sample = sample
+        self.import_rows = import_rows
+        self.latencies_ms = []
+        self.rows = 0
+
+    def timed(self, func, *args, rows=1, rows_from_result=False):
+        """
+        执行一次操作并记录耗时
+        :param rows: 本次操作处理的行数，用于计算吞吐量
+        :param rows_from_result: 为True时以返回结果的长度作为处理的行数
+        """
+        start = time.perf_counter()
+        result = func(*args)
+        self.latencies_ms.append((time.perf_counter() - start) * 1000)
+        self.rows += len(result) if rows_from_result and result is not None else rows
+        return result
+
+
+# 场景子进程在该时间（秒）内没有返回结果时视为卡死，终止子进程并记为失败
+SCENARIO_TIMEOUT = 3600
+
+
+def remove_database(db_path):
+    """
+    删除数据库文件及其WAL日志、共享内存等附属文件，避免之后同名的数据库重放过期的WAL
+    """
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def copy_database(source_path, target_path):
+    """
+    用SQLite备份接口复制数据库（包括尚未写回主文件的WAL内容），目标的旧文件及附属文件先删除
+    """
+    remove_database(target_path)
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def prepare_database(spec, seed, cache_dir):
+    """
+    生成（或复用已缓存的）合成数据库，返回数据库文件路径；该文件只作为复制的来源，场景都在副本上运行
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    db_path = os.path.join(cache_dir, f"bench_{spec['students']}_{spec['exams_per_student']}_{seed}.db")
+    if not os.path.exists(db_path):
+        tmp_path = db_path + ".tmp"
+        remove_database(tmp_path)
+        generate_database(tmp_path, spec, seed)
+        # 写回WAL后再改名，WAL文件不会跟随主文件改名
+        connection = sqlite3.connect(tmp_path)
+        try:
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            connection.close()
+        remove_database(db_path)
+        os.replace(tmp_path, db_path)
+        remove_database(tmp_path)
+    return db_path
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def current_rss_mb():
+    """
+    读取当前进程的常驻内存（MB），非Linux平台返回0
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _scenario_process(name, db_path, spec, options, queue):
+    """
+    子进程入口：运行单个场景并通过队列返回统计结果
+    """
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    db_engine = manager = None
+    try:
+        # 导入失败也要通过队列返回错误，否则父进程会一直等待
+        from sqlalchemy import create_engine
+
+        import ORM2
+        from benchmark.scenarios import SCENARIOS
+
+        db_engine = create_engine(f"sqlite:///{db_path}")
+        manager = ORM2.DatabaseManager(db_engine=db_engine)
+        ctx = ScenarioContext(manager, workdir, spec, options["seed"], options["repeat"],
+                              options["sample"], options["import_rows"])
+        rss_start = current_rss_mb()
+        start = time.perf_counter()
+        SCENARIOS[name][0](ctx)
+        total_s = time.perf_counter() - start
+        latencies = sorted(ctx.latencies_ms)
+        # ru_maxrss在Linux上以KB为单位
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        queue.put({
+            "ops": len(latencies),
+            "rows": ctx.rows,
+            "total_s": round(total_s, 4),
+            "ops_per_s": round(len(latencies) / total_s, 3) if total_s else 0.0,
+            "rows_per_s": round(ctx.rows / total_s, 3) if total_s else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+            "rss_start_mb": round(rss_start, 1),
+            "peak_rss_mb": round(peak_rss_mb, 1),
+        })
+    except Exception as e:
+        queue.put({"error": repr(e)})
+    finally:
+        if manager is not None:
+            manager.stop_age_refresh()
+            for engine in (manager.analytics_engine, manager.history_engine):
+                if engine is not None:
+                    engine.dispose()
+        if db_engine is not None:
+            db_engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_scenario(name, base_db_path, shared_db_path, spec, options, destructive, timeout=SCENARIO_TIMEOUT):
+    """
+    在独立子进程中运行场景。修改数据库的场景使用从基础数据库新复制的副本，运行后删除；
+    只读场景共用shared_db_path（同样是副本，打开数据库时的表结构升级不会写入缓存的基础数据库）
+    """
+    db_path = shared_db_path
+    if destructive:
+        db_path = base_db_path + f".{name}.tmp"
+        copy_database(base_db_path, db_path)
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_scenario_process, args=(name, db_path, spec, options, queue))
+    process.start()
+    try:
+        result = None
+        deadline = time.monotonic() + timeout
+        while result is None:
+            try:
+                result = queue.get(timeout=1)
+            except queue_module.Empty:
+                # 子进程已退出却没有返回结果（如崩溃、被系统终止），或运行超时
+                if process.exitcode is not None:
+                    result = {"error": f"场景子进程异常退出，退出码 {process.exitcode}"}
+                elif time.monotonic() > deadline:
+                    process.terminate()
+                    result = {"error": f"场景运行超过 {timeout} 秒，已终止"}
+        process.join()
+    finally:
+        if destructive:
+            remove_database(db_path)
+    return result
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    与基线比较，吞吐量下降或p95延迟上升超过tolerance（比例）视为性能退化
+    :return: 退化说明列表
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or "error" in result or "error" in base:
+            continue
+        if base["rows_per_s"] and result["rows_per_s"] < base["rows_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: 吞吐量 {result['rows_per_s']:.1f} 行/秒，基线 {base['rows_per_s']:.1f} 行/秒")
+        if base["p95_ms"] and result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95延迟 {result['p95_ms']:.2f}ms，基线 {base['p95_ms']:.2f}ms")
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_results(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
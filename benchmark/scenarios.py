@@ -0,0 +1,216 @@
+"""
+基准测试场景，每个场景通过ctx.timed执行并计时若干次操作
+"""
+import os
+import shutil
+import threading
+from datetime import date
+
+import ORM2
+from benchmark.datagen import write_student_file
+
+
+def file_import(ctx):
+    """
+    文件导入：读取学生CSV并逐条写入数据库（与界面中的“新增学生（文件导入）”流程一致）
+    """
+    file_path = os.path.join(ctx.workdir, "students_import.csv")
+    write_student_file(file_path, ctx.import_rows, seed=ctx.seed)
+
+    def run():
+        data, _ = ORM2.read_import_records(file_path, "student")
+        for student_info in data:
+            ctx.manager.add_student(student_info)
+
+    for _ in range(ctx.repeat):
+        ctx.timed(run, rows=ctx.import_rows)
+
+
+def get_data(ctx):
+    """
+    查询全部数据：get_student_data / get_exam_data / get_question_data / get_tag_data
+    """
+    for _ in range(ctx.repeat):
+        for getter in (ctx.manager.get_student_data, ctx.manager.get_exam_data,
+                       ctx.manager.get_question_data, ctx.manager.get_tag_data):
+            ctx.timed(getter, rows_from_result=True)
+
+
+def view_rendering(ctx):
+    """
+    界面渲染：查询数据并生成各查看界面的展示文本
+    """
+    views = ((ctx.manager.get_student_data, ORM2.GUI.format_student_data),
+             (ctx.manager.get_exam_data, ORM2.GUI.format_exam_data),
+             (ctx.manager.get_question_data, ORM2.GUI.format_question_data),
+             (ctx.manager.get_tag_data, ORM2.GUI.format_tag_data))
+    for _ in range(ctx.repeat):
+        for getter, formatter in views:
+            data = getter()
+            ctx.timed(formatter, data, rows=len(data))
+
+
+def deletes(ctx):
+    """
+    删除：按姓名删除学生、按编号删除考试
+    """
+    session = ctx.manager.Session()
+    names = [row[0] for row in session.query(ORM2.Student.name).order_by(ORM2.Student.id).limit(ctx.sample)]
+    exam_numbers = [row[0] for row in session.query(ORM2.Exam.exam_number).order_by(ORM2.Exam.id).limit(ctx.sample)]
+    session.close()
+    for name in names:
+        ctx.timed(ctx.manager.delete_student, name)
+    for exam_number in exam_numbers:
+        ctx.timed(ctx.manager.delete_exam, exam_number)
+
+
+def backup(ctx):
+    """
+    备份：导出学生数据备份文件
+    """
+    for i in range(ctx.repeat):
+        ctx.timed(ctx.manager.backup_data, os.path.join(ctx.workdir, f"backup_{i}"), rows=ctx.spec["students"])
+
+
+def analytics(ctx):
+    """
+    分析：考试排行榜、考试百分位、标签排行榜
+    """
+    exam_ids = [ctx.rng.randint(1, ctx.spec["exams"]) for _ in range(ctx.sample)]
+    student_ids = [ctx.rng.randint(1, ctx.spec["students"]) for _ in range(ctx.sample)]
+    tag_ids = [ctx.rng.randint(1, ctx.spec["tags"]) for _ in range(ctx.sample)]
+    for exam_id, student_id, tag_id in zip(exam_ids, student_ids, tag_ids):
+        ctx.timed(ctx.manager.get_exam_leaderboard, exam_id, 100, rows_from_result=True)
+        ctx.timed(ctx.manager.get_exam_percentile, exam_id, student_id)
+        ctx.timed(ctx.manager.get_tag_leaderboard, tag_id, 100, rows_from_result=True)
+
+
+def report_cards(ctx):
+    """
+    成绩报告单：批量查询全部学生的报告数据，渲染sample个学生的报告单，再次生成时内容未变化应全部跳过
+    """
+    student_ids = list(range(1, min(ctx.sample, ctx.spec["students"]) + 1))
+    output_dir = os.path.join(ctx.workdir, "reports")
+    for _ in range(ctx.repeat):
+        ctx.timed(lambda: ctx.manager.get_report_card_data()[2], rows_from_result=True)
+        shutil.rmtree(output_dir, ignore_errors=True)
+        ctx.timed(ORM2.generate_report_cards, ctx.manager, output_dir, 'png', student_ids, False, rows=len(student_ids))
+        ctx.timed(ORM2.generate_report_cards, ctx.manager, output_dir, 'png', student_ids, False, rows=len(student_ids))
+
+
+def recommendations(ctx):
+    """
+    题目推荐：全量刷新标签掌握度，再按每批sample个学生（相当于一个班）批量推荐题目
+    """
+    for _ in range(ctx.repeat):
+        ctx.timed(ctx.manager.refresh_tag_mastery, True, rows=ctx.spec["students"])
+        student_ids = ctx.rng.sample(range(1, ctx.spec["students"] + 1), min(ctx.sample, ctx.spec["students"]))
+        ctx.timed(ctx.manager.recommend_questions, student_ids, rows=len(student_ids))
+
+
+def paged_queries(ctx):
+    """
+    分页查询：查看界面的做法（COUNT加一页带关联数据的记录），以及按筛选条件、投影字段用游标遍历全部学生
+    """
+    for _ in range(ctx.repeat):
+        for entity in ORM2.QUERY_MODELS:
+            ctx.timed(ctx.manager.count_records, entity)
+            ctx.timed(lambda entity=entity: ctx.manager.query_records(
+                entity, limit=ORM2.VIEW_PAGE_SIZE, load_relations=True)[0], rows_from_result=True)
+        ctx.timed(ctx.manager.get_question_data, [('tag_id', '==', ctx.rng.randint(1, ctx.spec["tags"]))],
+                  rows_from_result=True)
+
+        def walk():
+            rows, cursor = [], None
+            while True:
+                page, cursor = ctx.manager.query_records('student', order_by=['-birth_date', 'name'],
+                                                         fields=['id', 'name', 'birth_date'],
+                                                         limit=ORM2.VIEW_PAGE_SIZE * 10, cursor=cursor)
+                rows.extend(page)
+                if cursor is None:
+                    return rows
+
+        ctx.timed(walk, rows_from_result=True)
+
+
+def crud_calls(ctx):
+    """
+    高频单条操作：按编号查考试、按ID修改学生、新增学生和标签，每次调用单独计时（衡量每次调用的固定开销），
+    每种操作调用sample*20次
+    """
+    calls = ctx.sample * 20
+    for i in range(calls):
+        ctx.timed(ctx.manager.get_exam_by_number, f"E{ctx.rng.randint(1, ctx.spec['exams']):06d}")
+    for i in range(calls):
+        ctx.timed(ctx.manager.update_student, {"id": ctx.rng.randint(1, ctx.spec["students"]), "name": f"改名{i}"})
+    for i in range(calls):
+        ctx.timed(ctx.manager.add_student, {"name": f"新生{i}", "birth_date": date(2010, 1, 1)})
+    for i in range(calls):
+        ctx.timed(ctx.manager.add_tag, {"content": f"新标签{i}"})
+
+
+def warm_start(ctx):
+    """
+    启动快照：生成快照后模拟重新启动（以mmap方式打开快照、清空排名缓存），计时首次考试汇总和各考试的首次排名查询
+    """
+    ctx.manager.snapshot_root = os.path.join(ctx.workdir, "snapshot")
+    ctx.timed(ctx.manager.write_snapshot)
+    exam_ids = list(range(1, ctx.spec["exams"] + 1))
+    for _ in range(ctx.repeat):
+        ctx.timed(ctx.manager.load_snapshot)
+        ctx.manager.ranking.invalidate()
+        ctx.timed(lambda: ctx.manager.get_exam_summary_data()[2], rows_from_result=True)
+        for exam_id in exam_ids:
+            ctx.timed(ctx.manager.get_exam_percentile, exam_id, ctx.rng.randint(1, ctx.spec["students"]))
+
+
+def age_refresh(ctx):
+    """
+    年龄刷新：用一条UPDATE按出生日期刷新全部学生的年龄（首次会修正合成数据中按年份相减得到的年龄），
+    再按计算年龄筛选、排序查询一页学生
+    """
+    for _ in range(ctx.repeat):
+        ctx.timed(ctx.manager.refresh_student_ages, rows=ctx.spec["students"])
+        ctx.timed(lambda: ctx.manager.query_records('student', [('current_age', '>=', 18)], order_by=['-current_age'],
+                                                    fields=['id', 'name', 'current_age'], limit=ORM2.VIEW_PAGE_SIZE)[0],
+                  rows_from_result=True)
+
+
+def analytics_while_writing(ctx):
+    """
+    读写隔离：后台线程持续生成全部学生的报告单数据（只读分析连接池），同时逐条新增学生并计时，
+    衡量长时间的统计查询对界面写入的影响
+    """
+    stop = threading.Event()
+
+    def run_reports():
+        while not stop.is_set():
+            ctx.manager.get_report_card_data()
+
+    reporter = threading.Thread(target=run_reports, daemon=True)
+    reporter.start()
+    try:
+        for i in range(ctx.sample * 4):
+            ctx.timed(ctx.manager.add_student, {"name": f"并发新生{i}", "birth_date": date(2010, 1, 1)})
+    finally:
+        stop.set()
+        ctx.manager.cancel_analytics()
+        reporter.join()
+
+
+# 场景名称 -> (场景函数, 是否修改数据库)；修改数据库的场景在数据库副本上运行
+SCENARIOS = {
+    "file_import": (file_import, True),
+    "get_data": (get_data, False),
+    "view_rendering": (view_rendering, False),
+    "deletes": (deletes, True),
+    "backup": (backup, False),
+    "analytics": (analytics, False),
+    "report_cards": (report_cards, False),
+    "recommendations": (recommendations, True),
+    "paged_queries": (paged_queries, False),
+    "crud_calls": (crud_calls, True),
+    "warm_start": (warm_start, False),
+    "age_refresh": (age_refresh, True),
+    "analytics_while_writing": (analytics_while_writing, True),
+}
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ORM2  # noqa: E402
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """
+    使用临时数据库文件的DatabaseManager
+    """
+    db_manager = ORM2.DatabaseManager(db_engine=create_engine(f"sqlite:///{tmp_path / 'school.db'}"))
+    yield db_manager
+    db_manager.stop_age_refresh()
+    db_manager.engine.dispose()
@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import literal, select
+
+import ORM2
+
+BIRTH_DATES = [date(2010, 3, 15), date(2012, 2, 29), date(2009, 12, 31), date(2011, 1, 1)]
+
+
+def sql_age(manager, birth_date, today):
+    with manager.engine.connect() as connection:
+        return connection.execute(select(ORM2.age_expression(literal(birth_date.isoformat()), today))).scalar()
+
+
+@pytest.mark.parametrize("birth_date", BIRTH_DATES)
+def test_age_expression_matches_calculate_age_around_birthdays(manager, birth_date):
+    for year in (2023, 2024, 2025):
+        try:
+            birthday = birth_date.replace(year=year)
+        except ValueError:
+            birthday = date(year, 3, 1)  # 闰日出生的学生在平年3月1日满岁
+        for today in (birthday - timedelta(days=1), birthday, birthday + timedelta(days=1)):
+            assert sql_age(manager, birth_date, today) == ORM2.calculate_age(birth_date, today), today
+
+
+def test_refresh_student_ages_updates_only_changed_rows(manager):
+    manager.add_students([{"name": f"学生{i}", "birth_date": birth_date} for i, birth_date in enumerate(BIRTH_DATES)]
+                         + [{"name": "无生日"}])
+    today = date(2024, 3, 14)
+    assert manager.refresh_student_ages(today)[0]
+    result, msg, report = manager.refresh_student_ages(today + timedelta(days=1))
+    assert result, msg
+    assert report["updated"] == 1  # 只有2010-03-15出生的学生当天满岁
+
+    session = manager.Session()
+    try:
+        rows = session.query(ORM2.Student.birth_date, ORM2.Student.age, ORM2.Student.version).all()
+    finally:
+        session.close()
+    for birth_date, age, version in rows:
+        assert age == ORM2.calculate_age(birth_date, today + timedelta(days=1))
+        assert version == 1
+
+
+def test_current_age_can_be_used_in_queries(manager):
+    manager.add_students([{"name": f"学生{i}", "birth_date": birth_date} for i, birth_date in enumerate(BIRTH_DATES)])
+    session = manager.Session()
+    try:
+        for age in range(10, 18):
+            names = [name for name, in session.query(ORM2.Student.name)
+                     .filter(ORM2.Student.current_age >= age).order_by(ORM2.Student.id)]
+            assert names == [f"学生{i}" for i, birth_date in enumerate(BIRTH_DATES)
+                             if ORM2.calculate_age(birth_date) >= age]
+    finally:
+        session.close()
@@ -0,0 +1,86 @@
+import logging
+import os
+from datetime import date
+
+import ORM2
+
+
+def setup_terms(manager):
+    manager.add_students([{"name": f"学生{i}", "birth_date": date(2010, 1, i)} for i in range(1, 4)])
+    manager.add_exams([{"exam_number": number, "time": time, "student_ids": [1, 2, 3]}
+                       for number, time in (("E1", "2023-10-01"), ("E2", "2023-12-01"), ("E3", "2024-03-01"))])
+    manager.upsert_scores({1: {1: 60, 2: 70, 3: 80}, 2: {1: 90, 2: 50, 3: 70}, 3: {1: 75, 2: 85, 3: 65}})
+
+
+def test_report_card_includes_archived_terms(manager, tmp_path):
+    setup_terms(manager)
+    assert manager.archive_term("2023秋", "2023-09-01", "2024-02-01", str(tmp_path / "archive"))[0]
+
+    result, msg, reports = manager.get_report_card_data([1])
+    assert result
+    assert [row[0] for row in reports[1]["history"]] == ["E1", "E2", "E3"]
+    assert [row[2] for row in reports[1]["history"]] == \
+        [row["score"] for row in manager.get_student_score_history(1, include_archived=True)]
+    assert reports[1]["missing_terms"] == []
+
+    result, msg, reports = manager.get_report_card_data([1], include_archived=False)
+    assert [row[0] for row in reports[1]["history"]] == ["E3"]
+
+
+def test_report_card_labels_missing_archive(manager, tmp_path):
+    setup_terms(manager)
+    result, msg, report = manager.archive_term("2023秋", "2023-09-01", "2024-02-01", str(tmp_path / "archive"))
+    assert result
+    os.chmod(report["file_path"], 0o600)
+    os.remove(report["file_path"])
+
+    result, msg, reports = manager.get_report_card_data([1])
+    assert result
+    assert [row[0] for row in reports[1]["history"]] == ["E3"]
+    assert reports[1]["missing_terms"] == [report["file_path"]]
+    assert "1 个归档学期" in msg
+
+
+
+def exam_numbers(exams):
+    return [exam.exam_number for exam in exams]
+
+
+def test_archive_moves_term_out_of_live_tables(manager, tmp_path):
+    setup_terms(manager)
+    result, msg, report = manager.archive_term("2023秋", "2023-09-01", "2024-02-01", str(tmp_path / "archive"))
+    assert result, msg
+    assert (report["exams"], report["scores"]) == (2, 6)
+    assert not os.stat(report["file_path"]).st_mode & 0o222
+    assert [term.name for term in manager.get_archived_terms()] == ["2023秋"]
+
+    assert exam_numbers(manager.get_exam_data()) == ["E3"]
+    assert manager.count_records("exam") == 1
+    assert len(manager.get_scores_in_range()) == 3
+    assert manager.get_exam_percentile(1, 1) is None
+
+
+def test_include_archived_reads_through_archive_files(manager, tmp_path):
+    setup_terms(manager)
+    assert manager.archive_term("2023秋", "2023-09-01", "2024-02-01", str(tmp_path / "archive"))[0]
+
+    assert exam_numbers(manager.get_exam_data(include_archived=True)) == ["E1", "E2", "E3"]
+    assert manager.count_records("exam", include_archived=True) == 3
+    assert len(manager.get_scores_in_range(include_archived=True)) == 9
+    assert exam_numbers(manager.get_exams_in_range("2023-11-01", "2024-12-31", include_archived=True)) == ["E2", "E3"]
+    assert [row["score"] for row in manager.get_student_score_history(2)] == [70, 50, 85]
+    assert [row["score"] for row in manager.get_student_score_history(2, include_archived=False)] == [85]
+    assert manager.get_unavailable_terms() == {}
+
+
+def test_archive_rejects_repeated_or_empty_terms(manager, tmp_path):
+    setup_terms(manager)
+    folder = str(tmp_path / "archive")
+    assert manager.archive_term("2023秋", "2023-09-01", "2024-02-01", folder)[0]
+    result, msg, _ = manager.archive_term("2023秋", "2024-02-01", "2024-09-01", folder)
+    assert not result and "已归档" in msg
+    result, msg, _ = manager.archive_term("2022秋", "2022-09-01", "2023-02-01", folder)
+    assert not result and "没有需要归档的考试" in msg
+    result, msg, _ = manager.archive_term("2024春", "not a date", "2024-09-01", folder)
+    assert not result and "格式不正确" in msg
+    assert exam_numbers(manager.get_exam_data()) == ["E3"]
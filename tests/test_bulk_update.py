@@ -0,0 +1,78 @@
+from datetime import date
+
+from sqlalchemy.orm import Session
+
+import ORM2
+
+
+def students(manager):
+    session = manager.Session()
+    try:
+        return {row.id: row for row in session.query(ORM2.Student.id, ORM2.Student.name, ORM2.Student.birth_date,
+                                                     ORM2.Student.age, ORM2.Student.version)}
+    finally:
+        session.close()
+
+
+def test_bulk_update_reports_version_conflicts(manager):
+    manager.add_students([{"name": "甲", "birth_date": date(2010, 1, 1)}, {"name": "乙", "birth_date": date(2011, 1, 1)}])
+    assert manager.update_student({"id": 2, "name": "乙2"})[0]
+
+    result, msg, report = manager.bulk_update_students([
+        {"id": 1, "name": "甲2", "version": 1},
+        {"id": 2, "name": "乙3", "version": 1},
+        {"id": 3, "name": "丙"},
+    ])
+    assert result, msg
+    assert [item["id"] for item in report["updated"]] == [1]
+    assert report["conflicts"] == [{"row": 2, "id": 2, "version": 1, "current_version": 2}]
+    assert report["missing"] == [3]
+    assert "已被他人修改而未覆盖 1 条" in msg
+    current = students(manager)
+    assert (current[1].name, current[1].version) == ("甲2", 2)
+    assert (current[2].name, current[2].version) == ("乙2", 2)
+
+
+def test_bulk_update_repeated_rows_build_on_each_other(manager):
+    manager.add_students([{"name": "甲", "birth_date": date(2010, 1, 1)}])
+    result, msg, report = manager.bulk_update_students([
+        {"id": 1, "name": "甲2"},
+        {"id": 1, "name": "甲2"},
+        {"id": 1, "birth_date": "2012-06-01"},
+    ])
+    assert result, msg
+    assert report["unchanged"] == 1
+    assert [list(item["changes"]) for item in report["updated"]] == [["name"], ["birth_date", "age"]]
+    current = students(manager)[1]
+    assert (current.name, current.birth_date, current.age, current.version) == \
+        ("甲2", date(2012, 6, 1), ORM2.calculate_age(date(2012, 6, 1)), 3)
+
+
+def test_bulk_update_natural_key_upsert_and_ambiguous_match(manager):
+    manager.add_students([{"name": "甲", "birth_date": date(2010, 1, 1)}, {"name": "甲", "birth_date": date(2010, 1, 1)}])
+    result, msg, report = manager.bulk_update_students([
+        {"name": "甲", "birth_date": "2010-01-01"},
+        {"name": "乙", "birth_date": "2011-02-03"},
+        {"name": "丙"},
+    ], match_on='natural', upsert=True)
+    assert result, msg
+    assert report["inserted"] == [("乙", date(2011, 2, 3))]
+    assert sorted(item["row"] for item in report["rejected"]) == [1, 3]
+    assert [row.name for row in students(manager).values()] == ["甲", "甲", "乙"]
+
+
+def test_bulk_update_rolls_back_when_a_row_changes_concurrently(manager, monkeypatch):
+    manager.add_students([{"name": "甲", "birth_date": date(2010, 1, 1)}, {"name": "乙", "birth_date": date(2011, 1, 1)}])
+    bulk_update_mappings = Session.bulk_update_mappings
+
+    # 读取现有记录之后、写入之前，另一个用户修改了第二条记录
+    def update_after_read(session, model, batch):
+        assert manager.update_student({"id": 2, "name": "乙2"})[0]
+        return bulk_update_mappings(session, model, batch)
+
+    monkeypatch.setattr(Session, "bulk_update_mappings", update_after_read)
+    result, msg, report = manager.bulk_update_students([{"id": 1, "name": "甲2"}, {"id": 2, "name": "乙3"}])
+    assert not result
+    assert "全部未保存" in msg
+    current = students(manager)
+    assert [(row.name, row.version) for row in current.values()] == [("甲", 1), ("乙2", 2)]
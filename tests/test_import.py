@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ORM2  # noqa: E402
+
+
+def test_non_integer_ids_are_rejected_per_row():
+    df = pd.DataFrame({"name": ["甲", "乙", "丙"], "birth_date": ["2010-01-01"] * 3, "id": ["1.5", "x", "3"]})
+    clean, rejected = ORM2.validate_import_frame(df, 'student')
+    assert clean["id"].tolist() == [3]
+    assert rejected["row"].tolist() == [2, 3]
+    assert all("id" in reason for reason in rejected["reason"])
+
+
+def test_non_integer_in_optional_int_columns():
+    df = pd.DataFrame({"content": ["a", "b", "c"], "parent_id": ["1.5", "2", ""], "version": ["1", "x", ""]})
+    clean, rejected = ORM2.validate_import_frame(df, 'tag')
+    assert rejected["row"].tolist() == [2, 3]
+    assert clean["content"].tolist() == ["c"]
+
+
+def test_import_file_reports_rejected_rows(tmp_path):
+    path = tmp_path / "students.csv"
+    pd.DataFrame({"name": ["甲", "乙"], "birth_date": ["2010-01-01", "2010-02-01"], "id": ["1.5", "2"]}) \
+        .to_csv(path, index=False)
+    records, rejected = ORM2.read_import_records(str(path), 'student')[:2]
+    assert [record["name"] for record in records] == ["乙"]
+    assert rejected["row"].tolist() == [2]
@@ -0,0 +1,62 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+import ORM2
+
+
+def synthetic_responses(n_students=600, n_items=15, seed=0, discrimination_range=(0.6, 2.0)):
+    rng = np.random.default_rng(seed)
+    theta = rng.normal(size=n_students)
+    difficulty = np.linspace(-2, 2, n_items)
+    discrimination = rng.uniform(*discrimination_range, n_items)
+    student_index, item_index = (grid.ravel() for grid in np.meshgrid(np.arange(n_students), np.arange(n_items),
+                                                                       indexing='ij'))
+    p = 1 / (1 + np.exp(-discrimination[item_index] * (theta[student_index] - difficulty[item_index])))
+    correct = (rng.random(len(p)) < p).astype(int)
+    return student_index, item_index, correct, theta, difficulty, discrimination
+
+
+def test_fit_irt_recovers_synthetic_parameters():
+    student_index, item_index, correct, theta, difficulty, discrimination = synthetic_responses()
+    fitted_theta, b, a, iterations, converged = ORM2.fit_irt(
+        student_index, item_index, correct, len(theta), len(difficulty), model='2pl')
+    assert converged and iterations < 200
+    assert np.corrcoef(b, difficulty)[0, 1] > 0.98
+    assert np.abs(b - difficulty).max() < 0.7
+    assert np.corrcoef(a, discrimination)[0, 1] > 0.8
+    assert np.corrcoef(fitted_theta, theta)[0, 1] > 0.85
+    assert abs(fitted_theta.mean()) < 1e-6 and fitted_theta.std() == pytest.approx(1)
+
+
+def test_fit_irt_1pl_keeps_unit_discrimination():
+    student_index, item_index, correct, theta, difficulty, _ = synthetic_responses(seed=1, discrimination_range=(1, 1))
+    _, b, a, _, converged = ORM2.fit_irt(student_index, item_index, correct, len(theta), len(difficulty), model='1pl')
+    assert converged
+    assert np.all(a == 1)
+    assert np.corrcoef(b, difficulty)[0, 1] > 0.98
+    with pytest.raises(ValueError):
+        ORM2.fit_irt(student_index, item_index, correct, len(theta), len(difficulty), model='3pl')
+
+
+def test_calibrate_questions_writes_back_difficulty(manager):
+    student_index, item_index, correct, theta, difficulty, _ = synthetic_responses(n_students=200, n_items=5, seed=2)
+    manager.add_students([{"name": f"学生{i}", "birth_date": date(2010, 1, 1)} for i in range(len(theta))])
+    manager.add_questions([{"question_number": f"Q{i}"} for i in range(len(difficulty) + 1)])
+    responses = [{"student_id": int(s) + 1, "question_id": int(q) + 1, "correct": int(c)}
+                 for s, q, c in zip(student_index, item_index, correct)]
+    # 第6题作答次数不足，不参与标定
+    responses += [{"student_id": 1, "question_id": 6, "correct": 1}]
+    assert manager.add_question_responses(responses)[2]["inserted"] == len(responses)
+
+    result, msg, report = manager.calibrate_questions(model='2pl', min_responses=20)
+    assert result, msg
+    assert (report["questions"], report["students"], report["responses"]) == (5, 200, 1000)
+    calibrated = manager.get_calibrated_questions()
+    assert [row["question_number"] for row in calibrated] == [f"Q{i}" for i in range(5)]
+    assert all(row["irt_response_count"] == 200 and row["irt_discrimination"] > 0 for row in calibrated)
+    assert [row["question_number"] for row in manager.get_calibrated_questions(min_difficulty=0.5)] == ["Q3", "Q4"]
+
+    result, msg, _ = manager.calibrate_questions(min_responses=500)
+    assert not result and "500" in msg
@@ -0,0 +1,58 @@
+from datetime import date
+
+import pytest
+
+
+@pytest.fixture
+def students(manager):
+    manager.add_students([{"name": f"学生{i:02d}", "birth_date": date(2005 + i % 5, 1 + i % 12, 1 + i % 28)}
+                          for i in range(23)])
+    return manager
+
+
+def test_cursor_paging_visits_every_row_once(students):
+    order_by = ['-birth_date', 'name']
+    expected = students.query_records('student', order_by=order_by, fields=['id'])[0]
+    seen, cursor = [], None
+    while True:
+        page, cursor = students.query_records('student', order_by=order_by, fields=['id'], limit=5, cursor=cursor)
+        seen.extend(page)
+        if cursor is None:
+            break
+    assert seen == expected
+    assert len(seen) == 23
+
+
+def test_filters_and_count_agree(students):
+    filters = [('birth_date', '>=', date(2007, 1, 1)), ('name', 'like', '学生1%')]
+    records = students.query_records('student', filters, fields=['name', 'birth_date'])[0]
+    assert records
+    assert all(record["birth_date"] >= date(2007, 1, 1) and record["name"].startswith("学生1") for record in records)
+    assert students.count_records('student', filters) == len(records)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"filters": [('nonexistent', '==', 1)]},
+    {"filters": [('name', '~=', 'x')]},
+    {"filters": [('name', '==')]},
+    {"filters": [('id', 'in', 5)]},
+    {"order_by": ['nonexistent']},
+    {"fields": ['nonexistent']},
+    {"cursor": 'not-a-cursor', "limit": 5},
+])
+def test_invalid_query_input_raises(students, kwargs):
+    with pytest.raises(ValueError):
+        students.query_records('student', **kwargs)
+
+
+def test_invalid_count_input_raises(students):
+    with pytest.raises(ValueError):
+        students.count_records('student', [('nonexistent', '==', 1)])
+    with pytest.raises(ValueError):
+        students.count_records('nonexistent')
+
+
+def test_cursor_from_another_ordering_is_rejected(students):
+    cursor = students.query_records('student', order_by=['name'], limit=5)[1]
+    with pytest.raises(ValueError):
+        students.query_records('student', order_by=['-name'], limit=5, cursor=cursor)
@@ -0,0 +1,72 @@
+from datetime import date
+
+import pytest
+
+import ORM2
+
+
+def setup_exam(manager):
+    manager.add_students([{"name": f"学生{i}", "birth_date": date(2010, 1, i)} for i in range(1, 5)])
+    manager.add_exams([{"exam_number": "E1", "time": "2024-01-01", "student_ids": [1, 2, 3, 4]}])
+    manager.upsert_scores({1: {1: 60, 2: 70, 3: 80, 4: 70}})
+
+
+def leaderboard(manager):
+    return [(row["rank"], row["student_id"], row["score"]) for row in manager.get_exam_leaderboard(1)]
+
+
+def test_leaderboard_and_percentile(manager):
+    setup_exam(manager)
+    assert leaderboard(manager) == [(1, 3, 80), (2, 4, 70), (2, 2, 70), (4, 1, 60)]
+    assert manager.get_exam_percentile(1, 3) == 87.5
+    assert manager.get_exam_percentile(1, 2) == 50.0
+    assert manager.get_exam_percentile(1, 99) is None
+
+
+def test_cached_ranking_follows_score_changes(manager):
+    setup_exam(manager)
+    assert manager.get_exam_percentile(1, 1) == 12.5  # 加载并缓存排名
+
+    manager.upsert_scores({1: {1: 90, 3: None}})
+    assert leaderboard(manager) == [(1, 1, 90), (2, 4, 70), (2, 2, 70)]
+    assert manager.get_exam_percentile(1, 3) is None
+
+    # 通过ORM会话修改的成绩在提交后更新缓存，回滚的修改不进入缓存
+    session = manager.Session()
+    try:
+        score = session.query(ORM2.StudentExamScore).filter_by(exam_id=1, student_id=2).one()
+        score.score = 100
+        session.flush()
+        session.rollback()
+        score = session.query(ORM2.StudentExamScore).filter_by(exam_id=1, student_id=4).one()
+        score.score = 50
+        session.commit()
+    finally:
+        session.close()
+    assert leaderboard(manager) == [(1, 1, 90), (2, 2, 70), (3, 4, 50)]
+    assert manager.get_exam_percentile(1, 4) == pytest.approx(100 / 6)
+
+
+def test_cached_ranking_is_cleared_with_deleted_exam(manager):
+    setup_exam(manager)
+    assert leaderboard(manager)
+    assert manager.delete_exam("E1")[0]
+    assert leaderboard(manager) == []
+
+
+def test_tag_leaderboard_uses_subtree_averages(manager):
+    setup_exam(manager)
+    manager.add_exams([{"exam_number": "E2", "time": "2024-02-01", "student_ids": [1, 2]}])
+    manager.upsert_scores({2: {1: 100, 2: 50}})
+    manager.add_tags([{"content": "代数"}, {"content": "方程", "parent_id": 1}])
+    session = manager.Session()
+    try:
+        session.execute(ORM2.tag_exam_association.insert(), [{"tag_id": 1, "exam_id": 1}, {"tag_id": 2, "exam_id": 2}])
+        session.commit()
+    finally:
+        session.close()
+
+    top = [(row["rank"], row["student_id"], row["avg_score"]) for row in manager.get_tag_leaderboard(1)]
+    assert top == [(1, 1, 80), (1, 3, 80), (3, 4, 70), (4, 2, 60)]
+    assert manager.get_tag_percentile(1, 2) == 12.5
+    assert [row["student_id"] for row in manager.get_tag_leaderboard(2)] == [1, 2]
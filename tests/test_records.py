@@ -0,0 +1,89 @@
+from datetime import date
+
+import ORM2
+
+
+def test_bulk_insert_keeps_fields_missing_from_the_first_row(manager):
+    result, msg, report = manager.add_tags([{"content": "root"}, {"content": "child", "parent_id": 1},
+                                            {"content": "grandchild", "parent_id": 2}])
+    assert result, msg
+    tree = {tag["content"]: tag for tag in manager.get_tag_tree()}
+    assert tree["root"]["parent_id"] is None
+    assert tree["child"]["parent_id"] == 1
+    assert tree["grandchild"]["parent_id"] == 2
+    assert tree["grandchild"]["depth"] == 2
+
+
+def test_bulk_insert_mixed_fields_keep_order_and_defaults(manager):
+    result, msg, _ = manager.add_students([{"name": "甲"}, {"name": "乙", "birth_date": date(2010, 5, 1)},
+                                           {"name": "丙"}])
+    assert result, msg
+    session = manager.Session()
+    try:
+        rows = session.query(ORM2.Student.name, ORM2.Student.birth_date, ORM2.Student.version) \
+            .order_by(ORM2.Student.id).all()
+    finally:
+        session.close()
+    assert rows == [("甲", None, 1), ("乙", date(2010, 5, 1), 1), ("丙", None, 1)]
+
+
+def student_row(manager, student_id):
+    session = manager.Session()
+    try:
+        return session.query(ORM2.Student.birth_date, ORM2.Student.age).filter(ORM2.Student.id == student_id).one()
+    finally:
+        session.close()
+
+
+def test_students_without_birth_date(manager):
+    assert manager.add_student({"name": "甲", "birth_date": None})[0]
+    assert manager.add_students([{"name": "乙"}])[0]
+    assert student_row(manager, 1) == (None, None)
+    assert student_row(manager, 2) == (None, None)
+
+
+def test_clearing_birth_date_clears_age(manager):
+    assert manager.add_students([{"name": "甲", "birth_date": date(2010, 1, 1)},
+                                 {"name": "乙", "birth_date": date(2011, 1, 1)}])[0]
+    assert student_row(manager, 1).age == ORM2.calculate_age(date(2010, 1, 1))
+
+    result, msg = manager.update_student({"id": 1, "birth_date": None})
+    assert result, msg
+    assert student_row(manager, 1) == (None, None)
+
+    result, msg, report = manager.bulk_update_students([{"id": 2, "birth_date": None}])
+    assert result, msg
+    assert report["updated"][0]["changes"]["age"][1] is None
+    assert student_row(manager, 2) == (None, None)
+
+    result, msg, report = manager.bulk_update_students([{"id": 99, "name": "丙", "birth_date": None}], upsert=True)
+    assert result, msg
+    assert report["inserted"] == [99]
+    assert student_row(manager, 3) == (None, None)
+
+
+def test_update_with_stale_version_is_rejected(manager):
+    manager.add_students([{"name": "甲", "birth_date": date(2010, 1, 1)}])
+    assert manager.update_student({"id": 1, "name": "甲2", "version": 1})[0]
+
+    result, msg = manager.update_student({"id": 1, "name": "甲3", "version": 1})
+    assert not result
+    assert "当前版本 2" in msg and "name='甲2'" in msg
+    result, msg = manager.update_student({"id": 1, "name": "甲3", "version": 2})
+    assert result, msg
+    session = manager.Session()
+    try:
+        assert session.query(ORM2.Student.name, ORM2.Student.version).one() == ("甲3", 3)
+    finally:
+        session.close()
+
+    result, msg = manager.update_student({"id": 2, "name": "乙", "version": 1})
+    assert not result and "未找到" in msg
+
+
+def test_tag_version_is_bumped_when_children_are_reparented(manager):
+    manager.add_tags([{"content": "代数"}, {"content": "方程", "parent_id": 1}])
+    assert manager.delete_tag("代数")[0]
+    # 删除上级标签时触发器修改了下级标签，按旧版本修改会被拒绝
+    result, msg = manager.update_tag({"id": 2, "content": "一元方程", "version": 1})
+    assert not result and "当前版本 2" in msg
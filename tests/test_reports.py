@@ -0,0 +1,42 @@
+import logging
+from datetime import date
+
+from sqlalchemy import event
+
+import ORM2
+
+
+def setup_exam(manager):
+    manager.add_students([{"name": f"学生{i}", "birth_date": date(2010, 1, i)} for i in range(1, 4)])
+    manager.add_exams([{"exam_number": "E1", "time": "2024-03-01", "student_ids": [1, 2, 3]}])
+    manager.upsert_scores({1: {1: 75, 2: 85, 3: 65}})
+
+
+def test_timed_out_report_query_is_not_logged_as_error(manager, monkeypatch, caplog):
+    setup_exam(manager)
+    monkeypatch.setattr(ORM2, "ANALYTICS_PROGRESS_STEPS", 1)
+    analytics_session = manager._analytics_session
+    monkeypatch.setattr(manager, "_analytics_session",
+                        lambda include_archived=False: analytics_session(include_archived, timeout=1e-9))
+
+    with caplog.at_level(logging.DEBUG, logger="school_db"):
+        result, msg, reports = manager.get_report_card_data()
+        summary_result, summary_msg, summaries = manager.get_exam_summary_data()
+    assert (result, reports) == (False, {})
+    assert (summary_result, summaries) == (False, {})
+    assert "被取消" in msg and "被取消" in summary_msg
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+
+
+def test_cancelled_report_query_is_logged_at_info(manager, monkeypatch, caplog):
+    setup_exam(manager)
+    monkeypatch.setattr(ORM2, "ANALYTICS_PROGRESS_STEPS", 1)
+    manager._analytics_session().close()
+    # 语句开始执行后立即取消，模拟界面上的cancel_analytics
+    event.listen(manager.analytics_engine, "before_cursor_execute", lambda *args: manager.cancel_analytics())
+
+    with caplog.at_level(logging.DEBUG, logger="school_db"):
+        result, msg, reports = manager.get_report_card_data(include_archived=False)
+    assert (result, reports) == (False, {})
+    assert [record.levelno for record in caplog.records if "已取消" in record.getMessage()] == [logging.INFO]
+    assert not [record for record in caplog.records if record.levelno >= logging.WARNING]
@@ -0,0 +1,57 @@
+import logging
+from datetime import date
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+import ORM2
+
+
+def setup_exam(manager):
+    manager.add_students([{"name": f"学生{i}", "birth_date": date(2010, 1, i)} for i in range(1, 5)])
+    manager.add_exams([{"exam_number": "E1", "time": "2024-01-01", "student_ids": [1, 2, 3, 4]}])
+
+
+def stored_scores(manager):
+    with manager.engine.connect() as connection:
+        return dict(connection.execute(text("SELECT student_id, score FROM student_exam_scores WHERE exam_id = 1")).all())
+
+
+def test_upsert_scores_rejects_invalid_values(manager):
+    setup_exam(manager)
+    result, msg, report = manager.upsert_scores({1: {1: 90, 2: 88.0, 3: np.int64(75), 4: True}})
+    assert [(item["student_id"], item["score"]) for item in report["rejected"]] == [(4, True)]
+    assert stored_scores(manager) == {1: 90, 2: 88, 3: 75, 4: None}
+
+    result, msg, report = manager.upsert_scores({1: {1: 1.5, 2: "80", 3: False}})
+    assert sorted(item["student_id"] for item in report["rejected"]) == [1, 2, 3]
+    assert stored_scores(manager) == {1: 90, 2: 88, 3: 75, 4: None}
+
+
+def test_upsert_scores_overwrites_and_clears(manager):
+    setup_exam(manager)
+    assert manager.upsert_scores({1: {1: 60, 2: 70}})[0]
+    assert manager.upsert_scores({1: {1: 65, 2: None}})[0]
+    assert stored_scores(manager) == {1: 65, 2: None, 3: None, 4: None}
+
+
+def test_upgrade_deduplicates_scores_before_unique_index(tmp_path, caplog):
+    url = f"sqlite:///{tmp_path / 'old.db'}"
+    manager = ORM2.DatabaseManager(db_engine=create_engine(url))
+    setup_exam(manager)
+    manager.upsert_scores({1: {1: 50}})
+    with manager.engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ux_student_exam_scores_student_exam")
+        connection.exec_driver_sql("INSERT INTO student_exam_scores (student_id, exam_id, score) VALUES (1, 1, 55)")
+        connection.exec_driver_sql("INSERT INTO student_exam_scores (student_id, exam_id, score) VALUES (1, 1, NULL)")
+    manager.engine.dispose()
+
+    with caplog.at_level(logging.WARNING, logger="school_db.database"):
+        upgraded = ORM2.DatabaseManager(db_engine=create_engine(url))
+    assert "2 条重复的成绩记录" in caplog.text
+    with upgraded.engine.connect() as connection:
+        rows = connection.execute(text("SELECT score FROM student_exam_scores WHERE student_id = 1 AND exam_id = 1")).all()
+        indexes = {row[1] for row in connection.exec_driver_sql("PRAGMA index_list(student_exam_scores)")}
+    assert rows == [(55,)]
+    assert "ux_student_exam_scores_student_exam" in indexes
+    upgraded.engine.dispose()
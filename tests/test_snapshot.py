@@ -0,0 +1,23 @@
+import logging
+from datetime import date
+
+
+def test_snapshot_round_trip_and_invalidation(manager):
+    manager.add_students([{"name": "甲", "birth_date": date(2010, 1, 1)}])
+    assert manager.write_snapshot()[0]
+    assert manager.load_snapshot()
+    session = manager.Session()
+    try:
+        assert manager._current_snapshot(session) is not None
+        manager.add_students([{"name": "乙", "birth_date": date(2010, 1, 2)}])
+        assert manager._current_snapshot(session) is None
+    finally:
+        session.close()
+
+
+def test_snapshot_open_failure_is_logged(manager, caplog):
+    with manager.engine.begin() as connection:
+        connection.exec_driver_sql("DROP TABLE db_meta")
+    with caplog.at_level(logging.WARNING, logger="school_db.snapshot"):
+        assert manager.load_snapshot() is False
+    assert "打开启动快照失败" in caplog.text
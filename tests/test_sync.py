@@ -0,0 +1,148 @@
+import os
+import shutil
+import sys
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ORM2  # noqa: E402
+
+
+def open_manager(path):
+    return ORM2.DatabaseManager(db_engine=create_engine(f"sqlite:///{path}"))
+
+
+def checkpoint(manager):
+    with manager.engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def score(manager, student_id, exam_id):
+    with manager.engine.connect() as connection:
+        return connection.execute(text("SELECT score, version FROM student_exam_scores "
+                                       "WHERE student_id = :student AND exam_id = :exam"),
+                                  {"student": student_id, "exam": exam_id}).first()
+
+
+def count(manager, table):
+    with manager.engine.connect() as connection:
+        return connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+
+
+@pytest.fixture
+def sites(tmp_path):
+    """
+    两个从同一份数据复制出来的校区数据库
+    """
+    path_a, path_b = str(tmp_path / "a.db"), str(tmp_path / "b.db")
+    site_a = open_manager(path_a)
+    site_a.add_students([{"name": f"学生{i}", "birth_date": date(2010, 1, i)} for i in range(1, 6)])
+    site_a.add_exams([{"exam_number": f"E{j}", "time": f"2024-0{j}-01", "student_ids": [1, 2, 3, 4, 5]}
+                      for j in range(1, 3)])
+    site_a.upsert_scores({j: {i: 60 + i for i in range(1, 6)} for j in range(1, 3)})
+    site_a.refresh_sync_hashes()
+    checkpoint(site_a)
+    shutil.copy(path_a, path_b)
+    site_b = open_manager(path_b)
+    yield site_a, site_b
+    site_a.engine.dispose()
+    site_b.engine.dispose()
+
+
+def test_score_edits_resolved_by_version(sites):
+    site_a, site_b = sites
+    site_a.upsert_scores({1: {1: 70}})
+    site_b.upsert_scores({1: {1: 80}})
+    site_b.upsert_scores({1: {1: 85}})  # B改了两次，版本号更大
+    assert score(site_b, 1, 1)[1] == score(site_a, 1, 1)[1] + 1
+
+    result, msg, _ = site_a.sync_with(site_b)
+    assert result, msg
+    assert score(site_a, 1, 1)[0] == 85
+    assert score(site_b, 1, 1)[0] == 85
+    assert site_a._sync_leaves() == site_b._sync_leaves()
+
+
+def test_concurrent_score_edits_converge(sites):
+    site_a, site_b = sites
+    site_a.upsert_scores({2: {2: 90}})
+    site_b.upsert_scores({2: {2: 91}})
+    result, msg, _ = site_a.sync_with(site_b)
+    assert result, msg
+    assert score(site_a, 2, 2)[0] == score(site_b, 2, 2)[0]
+    assert site_a._sync_leaves() == site_b._sync_leaves()
+
+
+def test_deletes_are_not_resurrected(sites):
+    site_a, site_b = sites
+    assert site_a.delete_student("学生3")[0]
+    site_a.upsert_scores({1: {1: 99}})
+    site_b.upsert_scores({1: {4: 10}})
+
+    result, msg, report = site_a.sync_with(site_b)
+    assert result, msg
+    assert report["students"]["pushed"]["deleted"] == 1
+    for manager in sites:
+        assert count(manager, "students") == 4
+        assert score(manager, 3, 1) is None
+        assert score(manager, 1, 1)[0] == 99
+        assert score(manager, 4, 1)[0] == 10
+    assert site_a._sync_leaves() == site_b._sync_leaves()
+
+    # 再次同步不会把删除的学生带回来
+    result, msg, _ = site_b.sync_with(site_a)
+    assert result, msg
+    assert count(site_a, "students") == count(site_b, "students") == 4
+
+
+def test_deleted_exam_takes_its_scores(sites):
+    site_a, site_b = sites
+    assert site_a.delete_exam("E2")[0]
+    site_b.upsert_scores({2: {5: 100}})  # B在不知道删除的情况下修改了该考试的一条成绩
+
+    result, msg, _ = site_a.sync_with(site_b)
+    assert result, msg
+    # 考试本身未被修改，按墓碑删除，成绩随考试一并删除
+    for manager in sites:
+        assert count(manager, "exams") == 1
+        assert score(manager, 5, 2) is None
+    assert site_a._sync_leaves() == site_b._sync_leaves()
+
+
+def test_edit_after_delete_wins(sites):
+    site_a, site_b = sites
+    with site_a.engine.begin() as connection:
+        connection.execute(text("DELETE FROM student_exam_scores WHERE student_id = 3 AND exam_id = 2"))
+    site_b.upsert_scores({2: {3: 77}})  # 删除的是修改前的版本
+
+    result, msg, report = site_a.sync_with(site_b)
+    assert result, msg
+    assert report["scores"]["pulled"]["inserted"] == 1
+    assert report["scores"]["pushed"]["kept"] == 1
+    for manager in sites:
+        assert score(manager, 3, 2)[0] == 77
+    assert site_a._sync_leaves() == site_b._sync_leaves()
+
+
+def test_deleted_score_and_recreated_record_in_bundle(sites, tmp_path):
+    site_a, site_b = sites
+    with site_a.engine.begin() as connection:
+        connection.execute(text("DELETE FROM student_exam_scores WHERE student_id = 2 AND exam_id = 1"))
+    assert site_a.delete_student("学生5")[0]
+    assert site_a.add_student({"name": "学生5", "birth_date": date(2010, 1, 5)})[0]
+
+    manifest, bundle, reply = (str(tmp_path / name) for name in ("b.manifest", "a.bundle", "b.bundle"))
+    assert site_b.export_sync_manifest(manifest)[0]
+    assert site_a.export_sync_bundle(bundle, manifest)[0]
+    result, msg, report = site_b.import_sync_bundle(bundle)
+    assert result, msg
+    assert report["scores"]["deleted"] >= 1
+    assert score(site_b, 2, 1) is None
+    # 重新新增的学生版本号高于墓碑，对方不会再删除它；它在B的旧成绩随删除一并移除
+    assert count(site_b, "students") == 5
+    assert site_b.export_sync_bundle(reply, bundle)[0]
+    assert site_a.import_sync_bundle(reply)[0]
+    assert count(site_a, "students") == 5
+    assert site_a._sync_leaves() == site_b._sync_leaves()
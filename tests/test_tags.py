@@ -0,0 +1,72 @@
+from datetime import date
+
+from sqlalchemy import text
+
+import ORM2
+
+
+def closure(manager):
+    with manager.engine.connect() as connection:
+        return set(connection.execute(text("SELECT ancestor_id, descendant_id, depth FROM tag_closure")).all())
+
+
+def setup_tree(manager):
+    # 1 数学 -> 2 代数 -> 3 方程；4 几何
+    manager.add_tags([{"content": "数学"}, {"content": "代数", "parent_id": 1}, {"content": "方程", "parent_id": 2},
+                      {"content": "几何"}])
+
+
+def test_insert_builds_closure(manager):
+    setup_tree(manager)
+    assert closure(manager) == {(1, 1, 0), (2, 2, 0), (3, 3, 0), (4, 4, 0),
+                                (1, 2, 1), (2, 3, 1), (1, 3, 2)}
+
+
+def test_child_imported_before_parent_is_connected(manager):
+    manager.add_tags([{"id": 2, "content": "代数", "parent_id": 1}, {"id": 1, "content": "数学"}])
+    assert closure(manager) == {(1, 1, 0), (2, 2, 0), (1, 2, 1)}
+
+
+def test_move_subtree(manager):
+    setup_tree(manager)
+    assert manager.update_tag({"id": 2, "parent_id": 4})[0]
+    assert closure(manager) == {(1, 1, 0), (2, 2, 0), (3, 3, 0), (4, 4, 0),
+                                (4, 2, 1), (2, 3, 1), (4, 3, 2)}
+    assert manager.update_tag({"id": 2, "parent_id": None})[0]
+    assert closure(manager) == {(1, 1, 0), (2, 2, 0), (3, 3, 0), (4, 4, 0), (2, 3, 1)}
+
+
+def test_cycles_are_rejected(manager):
+    setup_tree(manager)
+    before = closure(manager)
+    for parent_id in (2, 3):
+        result, msg = manager.update_tag({"id": 2, "parent_id": parent_id})
+        assert not result
+        assert "不能是它自己或它的下级标签" in msg
+    result, msg, _ = manager.add_tags([{"id": 5, "content": "自环", "parent_id": 5}])
+    assert not result
+    assert closure(manager) == before
+    assert [tag["parent_id"] for tag in manager.get_tag_tree() if tag["id"] == 2] == [1]
+
+
+def test_delete_reattaches_children(manager):
+    setup_tree(manager)
+    assert manager.delete_tag("代数")[0]
+    assert closure(manager) == {(1, 1, 0), (3, 3, 0), (4, 4, 0), (1, 3, 1)}
+    assert [(tag["content"], tag["depth"]) for tag in manager.get_tag_tree()] == [("数学", 0), ("方程", 1), ("几何", 0)]
+
+
+def test_subtree_queries_include_descendant_tags(manager):
+    setup_tree(manager)
+    manager.add_students([{"name": "甲", "birth_date": date(2010, 1, 1)}])
+    manager.add_exams([{"exam_number": f"E{i}", "time": f"2024-0{i}-01", "student_ids": [1]} for i in (1, 2, 3)])
+    session = manager.Session()
+    try:
+        session.execute(ORM2.tag_exam_association.insert(), [{"tag_id": 3, "exam_id": 1}, {"tag_id": 2, "exam_id": 2},
+                                                             {"tag_id": 3, "exam_id": 2}, {"tag_id": 4, "exam_id": 3}])
+        session.commit()
+    finally:
+        session.close()
+    assert [exam.exam_number for exam in manager.get_subtree_exams(1)] == ["E1", "E2"]
+    assert [exam.exam_number for exam in manager.get_subtree_exams(3)] == ["E1", "E2"]
+    assert [exam.exam_number for exam in manager.get_subtree_exams(4)] == ["E3"]
@@ -0,0 +1,111 @@
+import atexit
+import gc
+import sqlite3
+import threading
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import ORM2
+
+
+def disk_students(path):
+    connection = sqlite3.connect(path)
+    try:
+        return [row[0] for row in connection.execute("SELECT name FROM students ORDER BY id")]
+    finally:
+        connection.close()
+
+
+def open_working_copy(path):
+    return ORM2.DatabaseManager(db_engine=create_engine(f"sqlite:///{path}"), working_copy=True, flush_interval=None)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "school.db"
+    ORM2.DatabaseManager(db_engine=create_engine(f"sqlite:///{path}")).engine.dispose()
+    return str(path)
+
+
+def test_changes_reach_disk_only_on_flush(db_path):
+    manager = open_working_copy(db_path)
+    try:
+        assert manager.flush_to_disk()[0]
+        assert manager.working_copy.unflushed == 0
+        manager.add_students([{"name": "甲", "birth_date": date(2010, 1, 1)}])
+        assert manager.working_copy.unflushed == 1
+        assert disk_students(db_path) == []
+
+        assert manager.flush_to_disk()[0]
+        assert manager.working_copy.unflushed == 0
+        assert disk_students(db_path) == ["甲"]
+        # 只读查询不产生需要写回的修改
+        manager.get_student_data()
+        assert manager.working_copy.unflushed == 0
+    finally:
+        manager.working_copy.close()
+    assert not ORM2.os.path.exists(db_path + ".pending.jsonl")
+
+
+def test_journal_is_replayed_after_crash(db_path):
+    manager = open_working_copy(db_path)
+    manager.add_students([{"name": "甲", "birth_date": date(2010, 1, 1)}])
+    manager.update_student({"id": 1, "name": "甲2"})
+    # 模拟程序崩溃：不写回磁盘，变更日志保留
+    working_copy = manager.working_copy
+    atexit.unregister(working_copy.close)
+    working_copy._journal.close()
+    assert disk_students(db_path) == []
+
+    recovered = open_working_copy(db_path)
+    try:
+        assert disk_students(db_path) == ["甲2"]
+        assert [student.name for student in recovered.get_student_data()] == ["甲2"]
+    finally:
+        recovered.working_copy.close()
+    # 日志已随恢复重新开始，再次打开不会重复重放
+    reopened = open_working_copy(db_path)
+    try:
+        assert [student.name for student in reopened.get_student_data()] == ["甲2"]
+    finally:
+        reopened.working_copy.close()
+
+
+def test_journal_from_an_older_flush_is_not_replayed(db_path):
+    manager = open_working_copy(db_path)
+    manager.add_students([{"name": "甲", "birth_date": date(2010, 1, 1)}])
+    working_copy = manager.working_copy
+    with open(working_copy.journal_path, encoding='utf-8') as journal:
+        stale_journal = journal.read()
+    assert manager.flush_to_disk()[0]
+    # 写回后、清空日志前崩溃：日志头部的代数已落后于磁盘
+    atexit.unregister(working_copy.close)
+    working_copy._journal.close()
+    with open(working_copy.journal_path, "w", encoding='utf-8') as journal:
+        journal.write(stale_journal)
+
+    recovered = open_working_copy(db_path)
+    try:
+        assert disk_students(db_path) == ["甲"]
+    finally:
+        recovered.working_copy.close()
+
+
+def test_abandoned_session_does_not_block_flush(db_path):
+    manager = open_working_copy(db_path)
+    try:
+        session = manager.Session()
+        session.execute(text("INSERT INTO students (name) VALUES ('乙')"))
+        del session
+        gc.collect()
+        # 事务锁可重入，需在其他线程中写回才能确认锁已释放
+        flushed = []
+        thread = threading.Thread(target=lambda: flushed.append(manager.working_copy.flush(timeout=1)))
+        thread.start()
+        thread.join()
+        assert flushed == [True]
+        assert disk_students(db_path) == []
+    finally:
+        manager.working_copy.close()